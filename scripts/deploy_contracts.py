@@ -3,11 +3,15 @@
 import os
 import json
 import time
+import logging
 import random
 import subprocess # برای اجرای دستورات سیستمی
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 from eth_account import Account
 from eth_utils import to_checksum_address, decode_hex, encode_hex
+from tx_logger import get_logger, log_event, elapsed_ms
+from rpc_transport import PooledHTTPProvider, log_transport_stats
+from tx_journal import TxJournal
 
 # --- 1. تنظیمات (Configuration) ---
 
@@ -18,18 +22,13 @@ if not PRIVATE_KEY:
 if not PRIVATE_KEY.startswith("0x"):
     PRIVATE_KEY = "0x" + PRIVATE_KEY
 
+logger = get_logger('deploy_contracts')
+
 RPC_URL = "https://k8s.testnet.json-rpc.injective.network/" 
 CHAIN_ID = 1439 
 
 # تنظیمات Web3
-web3_provider = HTTPProvider(
-    RPC_URL,
-    request_kwargs={
-        'timeout': 60,
-        'verify': True,
-        'proxies': None
-    }
-)
+web3_provider = PooledHTTPProvider(RPC_URL) # pool اتصال keep-alive و timeout جداگانه برای هر متد (rpc_transport.py)
 w3 = Web3(web3_provider)
 
 try:
@@ -50,54 +49,98 @@ FIXED_GAS_PRICE_WEI = w3.to_wei('0.192', 'gwei')
 DEPLOY_GAS_LIMIT_SIMPLE_STORAGE = 2000000 
 DEPLOY_GAS_LIMIT_MY_NFT = 6000000 
 
+# ژورنال تراکنش‌های ارسال شده برای بازیابی پس از کرش
+journal = TxJournal()
+# شناسه اختیاری اجرای دیپلوی؛ فقط اگر تنظیم شده باشد، دیپلوی‌های موفق با همین شناسه در اجرای مجدد تکرار نمی‌شوند
+# (بدون آن هر اجرا همه دیپلوی‌ها را انجام می‌دهد و ژورنال فقط برای بازیابی تراکنش‌های معلق استفاده می‌شود)
+DEPLOY_SLOT = os.environ.get('DEPLOY_SLOT') or None
+
 # --- 2. توابع کمکی (Helper Functions) ---
 
-async def send_transaction(to_address, value, gas_limit, data, retries=10, delay=15):
-    """ارسال یک تراکنش امضا شده با قابلیت تلاش مجدد."""
-    for attempt in range(retries):
-        current_nonce = w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')
-        print(f"   (دریافت Nonce لحظه‌ای برای تلاش {attempt + 1}/{retries}: {current_nonce})")
+async def send_transaction(to_address, value, gas_limit, data, retries=10, delay=15, job=None, slot=None):
+    """ارسال یک تراکنش امضا شده با قابلیت تلاش مجدد.
+
+    اگر slot تنظیم شده و job در آن قبلاً (طبق ژورنال) انجام شده باشد، تراکنش ارسال نمی‌شود و None برمی‌گردد.
+    تا زمانی که تراکنش امضا شده در ژورنال معلق است، تلاش‌های بعدی همان تراکنش را دوباره ارسال می‌کنند.
+    """
+    if job and slot and journal.is_job_done(job, slot):
+        log_event(logger, logging.INFO, f'⏭️  Job {job} در {slot} قبلاً انجام شده است. رد شد.',
+                  stage='skipped', job=job, slot=slot, sample=False)
+        return None
+
+    # تراکنش معلق همین job در همین slot دوباره امضا نمی‌شود
+    tx_hash = journal.find_pending(job, slot) if job and slot else None
+    current_nonce = journal.pending[tx_hash]['nonce'] if tx_hash else None
 
+    for attempt in range(retries):
+        attempt_start = time.monotonic()
         try:
-            transaction = {
-                'from': SENDER_ADDRESS,
-                'to': to_checksum_address(to_address) if to_address else None,
-                'value': value,
-                'gas': gas_limit,
-                'gasPrice': FIXED_GAS_PRICE_WEI,
-                'nonce': current_nonce,
-                'chainId': CHAIN_ID,
-                'data': data
-            }
-            
-            signed_transaction = account.sign_transaction(transaction)
-            
-            print(f'🚀 در حال ارسال تراکنش دیپلوی به: {to_address if to_address else "شبکه (دیپلوی)"}، Nonce: {current_nonce}، Gas: {gas_limit} (تلاش {attempt + 1}/{retries})')
-            
-            tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction) # تغییر t کوچک به T بزرگ
-            print(f"  تراکنش ارسال شد. هش: {encode_hex(tx_hash)}")
+            if tx_hash not in journal.pending:
+                tx_hash = None
+                current_nonce = w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')
+                log_event(logger, logging.DEBUG, f"   (دریافت Nonce لحظه‌ای برای تلاش {attempt + 1}/{retries}: {current_nonce})",
+                          stage='nonce', nonce=current_nonce, attempt=attempt + 1, elapsed_ms=elapsed_ms(attempt_start))
+
+            if tx_hash is None:
+                transaction = {
+                    'from': SENDER_ADDRESS,
+                    'to': to_checksum_address(to_address) if to_address else None,
+                    'value': value,
+                    'gas': gas_limit,
+                    'gasPrice': FIXED_GAS_PRICE_WEI,
+                    'nonce': current_nonce,
+                    'chainId': CHAIN_ID,
+                    'data': data
+                }
+
+                signed_transaction = account.sign_transaction(transaction)
+
+                # ثبت در ژورنال قبل از ارسال (در صورت کرش، اجرای بعدی این تراکنش را پیگیری می‌کند)
+                tx_hash = journal.record_broadcast(signed_transaction, SENDER_ADDRESS, current_nonce, job=job, slot=slot)
+                log_event(logger, logging.INFO, f'🚀 در حال ارسال تراکنش دیپلوی به: {to_address if to_address else "شبکه (دیپلوی)"}، Nonce: {current_nonce}، Gas: {gas_limit} (تلاش {attempt + 1}/{retries})',
+                          stage='broadcast', tx_hash=tx_hash, to=to_address, nonce=current_nonce, attempt=attempt + 1, gas=gas_limit, job=job)
+            else:
+                log_event(logger, logging.INFO, f'🔁 ارسال مجدد همان تراکنش ثبت شده {tx_hash}، Nonce: {current_nonce} (تلاش {attempt + 1}/{retries})',
+                          stage='rebroadcast', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, job=job)
+
+            # "already known" یعنی نود تراکنش را دارد و فقط منتظر رسید می‌مانیم
+            journal.broadcast(w3, tx_hash)
+            broadcast_ms = elapsed_ms(attempt_start)
+            log_event(logger, logging.INFO, f"  تراکنش ارسال شد. هش: {tx_hash}",
+                      stage='sent', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, elapsed_ms=broadcast_ms)
             
             tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
+            journal.record_receipt(tx_hash, tx_receipt)
             
             if tx_receipt.status == 1:
-                print(f'✅ تراکنش موفق! هش: {encode_hex(tx_receipt.transactionHash)}, آدرس قرارداد: {tx_receipt.contractAddress}')
+                log_event(logger, logging.INFO, f'✅ تراکنش موفق! هش: {encode_hex(tx_receipt.transactionHash)}, آدرس قرارداد: {tx_receipt.contractAddress}',
+                          stage='confirmed', tx_hash=encode_hex(tx_receipt.transactionHash), nonce=current_nonce, attempt=attempt + 1,
+                          contract_address=tx_receipt.contractAddress, broadcast_ms=broadcast_ms, elapsed_ms=elapsed_ms(attempt_start), sample=False)
                 if tx_receipt.contractAddress:
                     explorer_url_tx_format = "https://testnet.blockscout.injective.network/tx/{}" 
-                    print(f"  مشاهده در اکسپلورر: {explorer_url_tx_format.format(encode_hex(tx_receipt.transactionHash))}")
+                    log_event(logger, logging.INFO, f"  مشاهده در اکسپلورر: {explorer_url_tx_format.format(encode_hex(tx_receipt.transactionHash))}",
+                              stage='explorer', tx_hash=encode_hex(tx_receipt.transactionHash))
                 return tx_receipt
             else:
-                print(f'❌ تراکنش رد شد. هش: {encode_hex(tx_receipt.transactionHash)}, وضعیت: {tx_receipt.status}')
+                log_event(logger, logging.ERROR, f'❌ تراکنش رد شد. هش: {encode_hex(tx_receipt.transactionHash)}, وضعیت: {tx_receipt.status}',
+                          stage='reverted', tx_hash=encode_hex(tx_receipt.transactionHash), nonce=current_nonce, attempt=attempt + 1,
+                          status=tx_receipt.status, elapsed_ms=elapsed_ms(attempt_start))
                 raise Exception(f"تراکنش با وضعیت {tx_receipt.status} شکست خورد.")
 
         except Exception as e:
             error_message = str(e)
-            print(f'🚨 خطا در ارسال تراکنش دیپلوی (Nonce: {current_nonce}, تلاش {attempt + 1}/{retries}): {error_message}')
+            # رد صریح نود یا رسید نهایی، تراکنش را از حالت معلق خارج می‌کند و تلاش بعدی تراکنش جدید امضا می‌کند؛
+            # در خطاهای انتقال (timeout، قطع اتصال) تلاش بعدی همان تراکنش را دوباره ارسال می‌کند تا دیپلوی تکراری نشود
+            log_event(logger, logging.WARNING, f'🚨 خطا در ارسال تراکنش دیپلوی (Nonce: {current_nonce}, تلاش {attempt + 1}/{retries}): {error_message}',
+                      stage='error', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, error=error_message, elapsed_ms=elapsed_ms(attempt_start))
             
-            if "invalid nonce" in error_message or "mempool is full" in error_message or "503" in error_message or "Service Temporarily Unavailable" in error_message or "nonce too low" in error_message or "already known" in error_message or "connection" in error_message.lower() or "timed out" in error_message.lower() or "gas required exceeds allowance" in error_message.lower():
-                print(f"   تلاش مجدد در {delay} ثانیه...")
+            if "invalid nonce" in error_message or "mempool is full" in error_message or "503" in error_message or "Service Temporarily Unavailable" in error_message or "nonce too low" in error_message or "connection" in error_message.lower() or "timed out" in error_message.lower() or "gas required exceeds allowance" in error_message.lower():
+                log_event(logger, logging.INFO, f"   تلاش مجدد در {delay} ثانیه...",
+                          stage='retry', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, delay=delay)
                 time.sleep(delay)
             else:
-                print("   خطای غیرقابل حل با تلاش مجدد. توقف.")
+                log_event(logger, logging.ERROR, "   خطای غیرقابل حل با تلاش مجدد. توقف.",
+                          stage='fatal', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, error=error_message)
                 raise 
     
     raise Exception(f"تراکنش دیپلوی بعد از {retries} تلاش ناموفق بود.")
@@ -105,7 +148,9 @@ async def send_transaction(to_address, value, gas_limit, data, retries=10, delay
 
 def compile_contract(contract_name, contract_path, contracts_base_path, project_root):
     """کامپایل یک فایل Solidity با استفاده از solc به صورت subprocess."""
-    print(f"\n--- در حال کامپایل {contract_name}.sol با solc مستقیم ---")
+    log_event(logger, logging.INFO, f"\n--- در حال کامپایل {contract_name}.sol با solc مستقیم ---",
+              stage='compile', contract=contract_name)
+    compile_start = time.monotonic()
     
     output_dir = os.path.dirname(contract_path)
     
@@ -126,9 +171,12 @@ def compile_contract(contract_name, contract_path, contracts_base_path, project_
         
         # اجرای دستور solc
         result = subprocess.run(command, capture_output=True, text=True, check=True)
-        print("Solc Output (stdout):\n", result.stdout)
+        # خروجی کامل solc فقط در سطح DEBUG ثبت می‌شود
+        log_event(logger, logging.DEBUG, f"Solc Output (stdout):\n {result.stdout}",
+                  stage='solc_stdout', contract=contract_name, stdout=result.stdout)
         if result.stderr:
-            print("Solc Errors (stderr):\n", result.stderr)
+            log_event(logger, logging.WARNING, f"Solc Errors (stderr):\n {result.stderr}",
+                      stage='solc_stderr', contract=contract_name, stderr=result.stderr)
 
         # خواندن ABI و Bytecode از فایل‌های تولید شده
         abi_file_path = os.path.join(output_dir, f"{contract_name}.abi")
@@ -139,18 +187,20 @@ def compile_contract(contract_name, contract_path, contracts_base_path, project_
         with open(bin_file_path, 'r') as f:
             bytecode = f.read().strip()
 
-        print(f"✅ {contract_name}.sol با موفقیت کامپایل شد و ABI/Bytecode از فایل‌ها خوانده شد.")
+        log_event(logger, logging.INFO, f"✅ {contract_name}.sol با موفقیت کامپایل شد و ABI/Bytecode از فایل‌ها خوانده شد.",
+                  stage='compiled', contract=contract_name, elapsed_ms=elapsed_ms(compile_start), sample=False)
         return bytecode, abi
     except subprocess.CalledProcessError as e:
-        print(f"🚨 خطا در اجرای solc برای {contract_name}.sol: {e}")
-        print(f"Solc stdout: {e.stdout}")
-        print(f"Solc stderr: {e.stderr}")
+        log_event(logger, logging.ERROR, f"🚨 خطا در اجرای solc برای {contract_name}.sol: {e}\nSolc stdout: {e.stdout}\nSolc stderr: {e.stderr}",
+                  stage='compile_failed', contract=contract_name, error=str(e), stdout=e.stdout, stderr=e.stderr)
         raise
     except FileNotFoundError:
-        print("🚨 خطا: دستور 'solc' پیدا نشد. مطمئن شوید solc نصب و در PATH سیستم است.")
+        log_event(logger, logging.ERROR, "🚨 خطا: دستور 'solc' پیدا نشد. مطمئن شوید solc نصب و در PATH سیستم است.",
+                  stage='compile_failed', contract=contract_name, error='solc not found')
         raise
     except Exception as e:
-        print(f"🚨 خطای ناشناخته در کامپایل {contract_name}.sol: {e}")
+        log_event(logger, logging.ERROR, f"🚨 خطای ناشناخته در کامپایل {contract_name}.sol: {e}",
+                  stage='compile_failed', contract=contract_name, error=str(e))
         raise
 
 # --- 3. تابع اصلی دیپلوی ---
@@ -158,6 +208,12 @@ def compile_contract(contract_name, contract_path, contracts_base_path, project_
 async def main():
     print('--- شروع فرآیند دیپلوی قراردادها ---')
 
+    # پیگیری تراکنش‌های معلق اجرای قبلی (به جای ارسال تکراری آن‌ها)
+    try:
+        journal.recover_pending(w3)
+    except Exception as e:
+        print(f'اخطار: خطا در بازیابی تراکنش‌های معلق: {e}')
+
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) 
     contracts_dir = os.path.join(project_root, "contracts")
 
@@ -188,7 +244,11 @@ async def main():
                 value=0,
                 gas_limit=DEPLOY_GAS_LIMIT_SIMPLE_STORAGE,
                 data=simple_storage_bytecode,
+                job=f'DEPLOY_SimpleStorage:{i + 1}',
+                slot=DEPLOY_SLOT,
             )
+            if receipt is None:
+                continue # در اجرای قبلی انجام شده است
             time.sleep(15) 
         except Exception as e:
             print(f"❌ دیپلوی SimpleStorage {i+1} شکست خورد: {e}")
@@ -203,13 +263,18 @@ async def main():
                 value=0,
                 gas_limit=DEPLOY_GAS_LIMIT_MY_NFT,
                 data=my_nft_bytecode,
+                job=f'DEPLOY_MyNFT:{i + 1}',
+                slot=DEPLOY_SLOT,
             )
+            if receipt is None:
+                continue # در اجرای قبلی انجام شده است
             time.sleep(15) 
         except Exception as e:
             print(f"❌ دیپلوی MyNFT {i+1} شکست خورد: {e}")
             time.sleep(5) 
 
     print('\n--- فرآیند دیپلوی قراردادها به پایان رسید. ---')
+    log_transport_stats(web3_provider, logger)
 
 if __name__ == '__main__':
     import asyncio
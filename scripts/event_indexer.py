@@ -0,0 +1,255 @@
+# scripts/event_indexer.py
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from eth_utils import to_checksum_address, encode_hex, keccak
+from requests.exceptions import RequestException
+
+# --- 1. تنظیمات (Configuration) ---
+
+# مسیر پایگاه داده محلی رویدادها (کنار فایل خروجی سواپ‌ها)
+EVENTS_DB_FILE = 'data/events.db'
+
+# اندازه هر بازه بلاک برای یک درخواست eth_getLogs
+CHUNK_SIZE = 2000
+# تعداد درخواست‌های همزمان eth_getLogs
+MAX_WORKERS = 8
+# در اولین اجرا (بدون سابقه) چند بلاک به عقب اسکن شود (حدود یک روز در Injective)
+INITIAL_LOOKBACK_BLOCKS = 150000
+# چند بلاک آخر برای اطمینان از نهایی شدن ایندکس نمی‌شوند
+CONFIRMATIONS = 2
+
+# امضای رویدادهای ERC20 / wINJ
+TRANSFER_TOPIC = encode_hex(keccak(text='Transfer(address,address,uint256)'))
+DEPOSIT_TOPIC = encode_hex(keccak(text='Deposit(address,uint256)'))
+WITHDRAWAL_TOPIC = encode_hex(keccak(text='Withdrawal(address,uint256)'))
+
+EVENT_NAMES = {
+    TRANSFER_TOPIC: 'Transfer',
+    DEPOSIT_TOPIC: 'Deposit',
+    WITHDRAWAL_TOPIC: 'Withdrawal',
+}
+
+# بازه زمانی (دقیقه) بعد از زمان‌بندی که تراکنش سواپ ممکن است در آن ثبت شده باشد
+# (پنجره 5 دقیقه‌ای شروع + تلاش‌های مجدد و انتظار برای رسید)
+SWAP_SLOT_WINDOW_MINUTES = 30
+
+# --- 2. پایگاه داده محلی (Local Store) ---
+
+def open_store(db_path=EVENTS_DB_FILE):
+    """باز کردن (یا ایجاد) پایگاه داده رویدادها به همراه ایندکس‌ها."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS events (
+            tx_hash TEXT NOT NULL,
+            log_index INTEGER NOT NULL,
+            block_number INTEGER NOT NULL,
+            block_timestamp INTEGER,
+            token TEXT NOT NULL,
+            event TEXT NOT NULL,
+            from_address TEXT,
+            to_address TEXT,
+            value TEXT NOT NULL,
+            PRIMARY KEY (tx_hash, log_index)
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_to ON events (to_address, token, block_timestamp);
+        CREATE INDEX IF NOT EXISTS idx_events_from ON events (from_address, token, block_timestamp);
+        CREATE INDEX IF NOT EXISTS idx_events_block ON events (block_number);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    ''')
+    return conn
+
+def _meta_key(address):
+    return f'last_block:{address.lower()}'
+
+def get_last_indexed_block(conn, address):
+    """آخرین بلاک ایندکس شده برای یک آدرس (یا None در صورت نبود سابقه)."""
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (_meta_key(address),)).fetchone()
+    return int(row[0]) if row else None
+
+# --- 3. دریافت و دیکد لاگ‌ها (Fetching & Decoding) ---
+
+def _address_topic(address):
+    """تبدیل آدرس به topic سی و دو بایتی برای فیلتر eth_getLogs."""
+    return '0x' + address.lower()[2:].zfill(64)
+
+def _topic_to_address(topic):
+    return to_checksum_address('0x' + encode_hex(topic)[-40:])
+
+def decode_log(log):
+    """دیکد یک لاگ Transfer/Deposit/Withdrawal به یک ردیف پایگاه داده."""
+    topic0 = encode_hex(log['topics'][0])
+    event = EVENT_NAMES.get(topic0)
+    if event is None:
+        return None
+    if event == 'Transfer':
+        if len(log['topics']) != 3:
+            return None # Transfer مربوط به ERC721 (4 topic، tokenId ایندکس شده) یا غیر استاندارد
+        from_address = _topic_to_address(log['topics'][1])
+        to_address = _topic_to_address(log['topics'][2])
+    elif event == 'Deposit':
+        from_address = None
+        to_address = _topic_to_address(log['topics'][1])
+    else: # Withdrawal
+        from_address = _topic_to_address(log['topics'][1])
+        to_address = None
+    data = log['data']
+    value = int.from_bytes(data, 'big') if isinstance(data, (bytes, bytearray)) else int(data, 16)
+    return (
+        encode_hex(log['transactionHash']),
+        log['logIndex'],
+        log['blockNumber'],
+        None, # timestamp بعداً پر می‌شود
+        to_checksum_address(log['address']),
+        event,
+        from_address,
+        to_address,
+        str(value), # uint256 در INTEGER پایگاه داده جا نمی‌شود
+    )
+
+def _get_logs_chunk(w3, token_addresses, address_topic, from_block, to_block):
+    """دریافت لاگ‌های مرتبط با آدرس ما در یک بازه؛ اگر نود بازه را رد کند، بازه نصف می‌شود."""
+    try:
+        # Transfer از طرف ما + Deposit/Withdrawal ما
+        outgoing = w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': token_addresses,
+            'topics': [[TRANSFER_TOPIC, DEPOSIT_TOPIC, WITHDRAWAL_TOPIC], address_topic],
+        })
+        # Transfer به سمت ما
+        incoming = w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': token_addresses,
+            'topics': [TRANSFER_TOPIC, None, address_topic],
+        })
+        return list(outgoing) + list(incoming)
+    except ValueError as e:
+        # نود درخواست را رد کرده است (خطای JSON-RPC)؛ احتمالاً بازه یا تعداد نتایج بیش از حد مجاز است.
+        # خطاهای انتقال (timeout، قطع اتصال) تقسیم نمی‌شوند تا بلافاصله به فراخواننده برسند.
+        if isinstance(e, RequestException) or from_block >= to_block:
+            raise
+        middle = (from_block + to_block) // 2
+        return _get_logs_chunk(w3, token_addresses, address_topic, from_block, middle) + \
+               _get_logs_chunk(w3, token_addresses, address_topic, middle + 1, to_block)
+
+def _store_events(conn, w3, executor, address, rows, last_block):
+    """ذخیره رویدادهای یک دسته به همراه آخرین بلاک کامل شده در یک تراکنش پایگاه داده."""
+    # زمان بلاک‌ها فقط برای بلاک‌هایی که رویداد دارند دریافت می‌شود
+    block_numbers = sorted({row[2] for row in rows.values()})
+    timestamps = dict(zip(
+        block_numbers,
+        executor.map(lambda n: w3.eth.get_block(n)['timestamp'], block_numbers),
+    ))
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [row[:3] + (timestamps[row[2]],) + row[4:] for row in rows.values()],
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (_meta_key(address), str(last_block)),
+        )
+
+def sync_events(w3, address, token_addresses, db_path=EVENTS_DB_FILE, start_block=None):
+    """اسکن افزایشی بلاک‌ها از آخرین بلاک ایندکس شده و ذخیره رویدادها. تعداد رویدادهای جدید را برمی‌گرداند."""
+    conn = open_store(db_path)
+    try:
+        latest_block = w3.eth.block_number - CONFIRMATIONS
+        last_indexed = get_last_indexed_block(conn, address)
+        if last_indexed is not None:
+            from_block = last_indexed + 1
+        elif start_block is not None:
+            from_block = start_block
+        else:
+            from_block = max(latest_block - INITIAL_LOOKBACK_BLOCKS, 0)
+
+        if from_block > latest_block:
+            return 0
+
+        print(f'ایندکس رویدادها از بلاک {from_block} تا {latest_block} (بازه‌های {CHUNK_SIZE} بلاکی)...')
+        address_topic = _address_topic(address)
+        token_addresses = [to_checksum_address(a) for a in token_addresses]
+        chunks = [
+            (start, min(start + CHUNK_SIZE - 1, latest_block))
+            for start in range(from_block, latest_block + 1, CHUNK_SIZE)
+        ]
+
+        # بازه‌ها در دسته‌های MAX_WORKERS تایی دریافت می‌شوند و پیشرفت بعد از هر دسته ذخیره می‌شود؛
+        # اگر یک بازه شکست بخورد، بازه‌های کامل شده قبل از آن حفظ می‌شوند و اجرای بعدی از همان‌جا ادامه می‌دهد
+        total_events = 0
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for batch_start in range(0, len(chunks), MAX_WORKERS):
+                batch = chunks[batch_start:batch_start + MAX_WORKERS]
+                futures = [
+                    executor.submit(_get_logs_chunk, w3, token_addresses, address_topic, chunk[0], chunk[1])
+                    for chunk in batch
+                ]
+                rows = {}
+                last_completed_block = None
+                error = None
+                for chunk, future in zip(batch, futures):
+                    try:
+                        logs = future.result()
+                    except Exception as e:
+                        error = e
+                        break # فقط بازه‌های پیوسته از ابتدا ذخیره می‌شوند
+                    for log in logs:
+                        row = decode_log(log)
+                        if row:
+                            rows[(row[0], row[1])] = row # حذف تکراری‌ها (مثلاً Transfer از ما به خودمان)
+                    last_completed_block = chunk[1]
+
+                if last_completed_block is not None:
+                    _store_events(conn, w3, executor, address, rows, last_completed_block)
+                    total_events += len(rows)
+                if error is not None:
+                    print(f'ایندکس در بلاک {last_completed_block if last_completed_block is not None else from_block - 1} متوقف شد ({total_events} رویداد ذخیره شد).')
+                    raise error
+
+        print(f'{total_events} رویداد جدید ایندکس شد. آخرین بلاک: {latest_block}')
+        return total_events
+    finally:
+        conn.close()
+
+# --- 4. تطبیق سواپ‌ها (Swap Reconciliation) ---
+
+def find_swap_output(recipient, input_token, output_token, run_time_key, now_utc, db_path=EVENTS_DB_FILE):
+    """یافتن مقدار توکن خروجی دریافتی در سواپِ زمان run_time_key (مثلاً '12:00') از داده‌های ایندکس شده.
+
+    سواپ تراکنشی است که در آن توکن ورودی از طرف ما و توکن خروجی به سمت ما منتقل شده است.
+    اگر چیزی پیدا نشود None برمی‌گرداند.
+    """
+    hour, minute = (int(part) for part in run_time_key.split(':'))
+    slot_start = now_utc.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot_start > now_utc:
+        slot_start -= timedelta(days=1) # مثلاً سواپ 00:00 از خروجی 19:00 روز قبل استفاده می‌کند
+    slot_end = slot_start + timedelta(minutes=SWAP_SLOT_WINDOW_MINUTES)
+
+    conn = open_store(db_path)
+    try:
+        row = conn.execute('''
+            SELECT received.value FROM events AS received
+            JOIN events AS sent ON sent.tx_hash = received.tx_hash
+            WHERE received.event = 'Transfer' AND received.token = ? AND received.to_address = ?
+              AND sent.event = 'Transfer' AND sent.token = ? AND sent.from_address = ?
+              AND received.block_timestamp >= ? AND received.block_timestamp < ?
+            ORDER BY received.block_number DESC, received.log_index DESC
+            LIMIT 1
+        ''', (
+            to_checksum_address(output_token), to_checksum_address(recipient),
+            to_checksum_address(input_token), to_checksum_address(recipient),
+            int(slot_start.timestamp()), int(slot_end.timestamp()),
+        )).fetchone()
+        return int(row[0]) if row else None
+    finally:
+        conn.close()
@@ -0,0 +1,174 @@
+# scripts/rpc_transport.py
+
+import time
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from web3 import HTTPProvider
+from tx_logger import log_event
+
+# --- 1. تنظیمات (Configuration) ---
+
+# تعداد اتصال‌های keep-alive نگهداری شده برای RPC (برای درخواست‌های همزمان ایندکسر کافی باشد)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# زمان‌های انتظار (connect, read) به ثانیه برای هر متد RPC؛ این سقف واقعی هر فراخوانی است
+# چون middleware تلاش مجدد web3 حذف شده است. خواندن‌های سبک سریع شکست می‌خورند
+# تا یک درخواست گیر کرده کل تراکنش‌ها را متوقف نکند
+DEFAULT_TIMEOUT = (5, 15)
+METHOD_TIMEOUTS = {
+    'eth_sendRawTransaction': (5, 30),
+    'eth_getTransactionReceipt': (5, 10),
+    'eth_getTransactionCount': (5, 10),
+    'eth_getTransactionByHash': (5, 10),
+    'eth_blockNumber': (5, 10),
+    'eth_chainId': (5, 10),
+    'eth_getBlockByNumber': (5, 30),
+    'eth_getLogs': (5, 60),
+}
+
+# متدهای فقط-خواندنی که پس از timeout، قطع اتصال یا پاسخ 5xx دوباره تلاش می‌شوند.
+# eth_sendRawTransaction عمداً اینجا نیست؛ ارسال مجدد در tx_journal مدیریت می‌شود
+IDEMPOTENT_METHODS = {
+    'eth_getTransactionReceipt',
+    'eth_getTransactionCount',
+    'eth_getTransactionByHash',
+    'eth_blockNumber',
+    'eth_chainId',
+    'eth_getBlockByNumber',
+    'eth_getLogs',
+    'web3_clientVersion',
+}
+# حداکثر تعداد تلاش مجدد متدهای بالا و فاصله (ثانیه) قبل از هر تلاش؛ یک خواندن گیر کرده
+# به جای شکست کل تراکنش، پس از timeout کوتاه خودش دوباره تلاش می‌شود
+READ_RETRIES = 2
+READ_RETRY_BACKOFF = (0.5, 1.0)
+
+# --- 2. شمارش اتصال‌ها (Connection Counting) ---
+
+# تعداد اتصال‌های جدیدی که در درخواست جاری (همین thread) باز شده‌اند
+_new_connections = threading.local()
+
+def _count_new_connection():
+    _new_connections.count = getattr(_new_connections, 'count', 0) + 1
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter که باز شدن هر اتصال TCP/TLS جدید را ثبت می‌کند."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+# --- 3. Provider ---
+
+def _is_retryable(error):
+    """خطاهای گذرای انتقال: timeout، قطع اتصال یا خطای 5xx سرور/پروکسی."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return True
+
+class PooledHTTPProvider(HTTPProvider):
+    """HTTPProvider با pool اتصال keep-alive، timeout جداگانه برای هر متد و آمار انتقال به تفکیک متد."""
+
+    # http_retry_request_middleware پیش‌فرض هر درخواست را تا 5 بار روی Timeout تکرار می‌کند
+    # (از جمله eth_sendRawTransaction) و timeout های هر متد را بی‌اثر می‌کند
+    _middlewares = ()
+
+    def __init__(self, endpoint_uri, method_timeouts=None, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        super().__init__(endpoint_uri)
+        self.method_timeouts = dict(METHOD_TIMEOUTS, **(method_timeouts or {}))
+        self.session = requests.Session()
+        adapter = _CountingAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0, # تلاش مجدد در make_request و send_transaction مدیریت می‌شود
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # requests به صورت پیش‌فرض Accept-Encoding: gzip, deflate و Connection: keep-alive می‌فرستد
+        self.session.headers.update(self.get_request_headers())
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        retries = READ_RETRIES if method in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            try:
+                return self._post(method, request_data)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+                if attempt == retries or not _is_retryable(e):
+                    raise
+                time.sleep(READ_RETRY_BACKOFF[min(attempt, len(READ_RETRY_BACKOFF) - 1)])
+
+    def _post(self, method, request_data):
+        timeout = self.method_timeouts.get(method, DEFAULT_TIMEOUT)
+        _new_connections.count = 0
+        response = None
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.endpoint_uri, data=request_data, timeout=timeout)
+            response.raise_for_status()
+        finally:
+            # در صورت خطا هم اتصال‌ها و زمان مصرف شده ثبت می‌شوند
+            self._record(method, time.monotonic() - start, len(request_data), response)
+        return self.decode_rpc_response(response.content)
+
+    def _record(self, method, duration, bytes_sent, response):
+        with self._stats_lock:
+            stats = self._stats.setdefault(method, {
+                'requests': 0,
+                'connections': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0, # بایت‌های روی شبکه (فشرده)
+                'bytes_decoded': 0,  # بایت‌های پس از باز کردن فشرده‌سازی
+                'time_ms': 0.0,
+            })
+            stats['requests'] += 1
+            stats['connections'] += _new_connections.count
+            stats['bytes_sent'] += bytes_sent
+            stats['time_ms'] += duration * 1000
+            if response is not None and response.raw is not None:
+                stats['bytes_received'] += response.raw.tell()
+                stats['bytes_decoded'] += len(response.content or b'')
+
+    def get_stats(self):
+        """کپی آمار انتقال به تفکیک متد RPC."""
+        with self._stats_lock:
+            return {method: dict(stats) for method, stats in self._stats.items()}
+
+def log_transport_stats(provider, logger):
+    """ثبت آمار انتقال به تفکیک متد و سربار انتقال به ازای هر تراکنش ارسال شده."""
+    stats = provider.get_stats()
+    for method, method_stats in sorted(stats.items()):
+        log_event(logger, logging.INFO,
+                  f'   {method}: {method_stats["requests"]} درخواست، {method_stats["connections"]} اتصال جدید، '
+                  f'{method_stats["bytes_sent"]}/{method_stats["bytes_received"]} بایت ارسال/دریافت ({method_stats["bytes_decoded"]} پس از باز کردن فشرده‌سازی)',
+                  stage='transport', method=method, sample=False, **method_stats)
+
+    sent_transactions = stats.get('eth_sendRawTransaction', {}).get('requests', 0)
+    if sent_transactions:
+        total_bytes = sum(m['bytes_sent'] + m['bytes_received'] for m in stats.values())
+        total_connections = sum(m['connections'] for m in stats.values())
+        log_event(logger, logging.INFO,
+                  f'   سربار انتقال به ازای هر تراکنش: {total_bytes / sent_transactions:.0f} بایت، '
+                  f'{total_connections / sent_transactions:.2f} اتصال جدید',
+                  stage='transport_per_tx', transactions=sent_transactions,
+                  bytes_per_tx=round(total_bytes / sent_transactions), connections_per_tx=round(total_connections / sent_transactions, 3),
+                  sample=False)
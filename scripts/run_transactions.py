@@ -3,11 +3,16 @@
 import os
 import json
 import time
+import logging
 from datetime import datetime, timedelta
 import pytz # برای مدیریت دقیق زمان‌های UTC
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 from eth_account import Account
 from eth_utils import to_checksum_address, decode_hex, encode_hex
+from event_indexer import sync_events, find_swap_output
+from tx_logger import get_logger, log_event, elapsed_ms
+from rpc_transport import PooledHTTPProvider, log_transport_stats
+from tx_journal import TxJournal
 
 # --- 1. تنظیمات (Configuration) ---
 
@@ -22,19 +27,14 @@ IS_TEST_MODE = os.environ.get('TEST_MODE') == 'true'
 if IS_TEST_MODE:
     print('حالت تست فعال است. تمام تراکنش‌ها بدون بررسی زمان‌بندی اجرا خواهند شد.')
 
+logger = get_logger('run_transactions')
+
 # اطلاعات شبکه Injective Testnet
 RPC_URL = 'https://k8s.testnet.json-rpc.injective.network/' 
 CHAIN_ID = 1439 # Chain ID تست‌نت Injective
 
 # تنظیمات Web3
-web3Provider = HTTPProvider(
-    RPC_URL,
-    request_kwargs={
-        'timeout': 60,    # افزایش زمان timeout به 60 ثانیه (برای اطمینان کامل)
-        'verify': True,   # بررسی گواهینامه‌های SSL
-        'proxies': None   # اطمینان از عدم استفاده از پراکسی
-    }
-)
+web3Provider = PooledHTTPProvider(RPC_URL) # pool اتصال keep-alive و timeout جداگانه برای هر متد (rpc_transport.py)
 w3 = Web3(web3Provider) # استفاده از web3Provider سفارشی
 
 # اطمینان از اتصال به شبکه
@@ -77,6 +77,9 @@ GAS_LIMITS = {
 # مسیر فایل برای ذخیره خروجی سواپ‌های دینامیک
 SWAP_OUTPUTS_FILE = 'data/swap_outputs.json'
 
+# ژورنال تراکنش‌های ارسال شده برای بازیابی پس از کرش
+journal = TxJournal()
+
 # پیکربندی تمام تراکنش‌ها با زمان‌بندی و جزئیات
 ALL_TRANSACTIONS = [
   {
@@ -199,46 +202,102 @@ def write_swap_outputs(data):
     except Exception as e:
         print(f'خطا در نوشتن در فایل {SWAP_OUTPUTS_FILE}: {e}')
 
-async def send_transaction(to_address, value, gas_limit, data, retries=10, delay=20):
-    """ارسال یک تراکنش امضا شده با قابلیت تلاش مجدد."""
-    for attempt in range(retries):
-        current_nonce = w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')
-        print(f"   (دریافت Nonce لحظه‌ای برای تلاش {attempt + 1}/{retries}: {current_nonce})")
+def reconcile_swap_input(run_time_key):
+    """ایندکس رویدادهای جدید و یافتن wINJ دریافتی از سواپ USDT به wINJ در زمان run_time_key."""
+    try:
+        token_addresses = [
+            CONTRACT_ADDRESSES['USDT_TOKEN'],
+            CONTRACT_ADDRESSES['SWAP_WINJ_TOKEN'],
+            CONTRACT_ADDRESSES['WARP_UNWARP_WINJ'],
+        ]
+        sync_events(w3, SENDER_ADDRESS, token_addresses)
+        return find_swap_output(
+            recipient=SENDER_ADDRESS,
+            input_token=CONTRACT_ADDRESSES['USDT_TOKEN'],
+            output_token=CONTRACT_ADDRESSES['SWAP_WINJ_TOKEN'],
+            run_time_key=run_time_key,
+            now_utc=datetime.now(pytz.utc),
+        )
+    except Exception as e:
+        # ایندکسر کمکی است؛ در صورت خطا به فایل JSON بسنده می‌کنیم
+        print(f'اخطار: خطا در ایندکس/تطبیق رویدادهای زنجیره: {e}')
+        return None
+
+async def send_transaction(to_address, value, gas_limit, data, retries=10, delay=20, job=None, slot=None):
+    """ارسال یک تراکنش امضا شده با قابلیت تلاش مجدد.
+
+    اگر job در بازه زمان‌بندی slot قبلاً (طبق ژورنال) انجام شده باشد، تراکنش ارسال نمی‌شود و None برمی‌گردد.
+    تا زمانی که تراکنش امضا شده در ژورنال معلق است، تلاش‌های بعدی همان تراکنش را دوباره ارسال می‌کنند
+    و تراکنش جدیدی (با nonce جدید) امضا نمی‌شود.
+    """
+    if job and journal.is_job_done(job, slot):
+        log_event(logger, logging.INFO, f'   Job {job} در بازه {slot} قبلاً انجام شده است. رد شد.',
+                  stage='skipped', job=job, slot=slot, sample=False)
+        return None
+
+    # تراکنش معلق همین job (مثلاً از اجرای قبلی که بازیابی آن تمام نشد) دوباره امضا نمی‌شود
+    tx_hash = journal.find_pending(job, slot) if job else None
+    current_nonce = journal.pending[tx_hash]['nonce'] if tx_hash else None
 
+    for attempt in range(retries):
+        attempt_start = time.monotonic()
         try:
-            transaction = {
-                'from': SENDER_ADDRESS,
-                'to': to_checksum_address(to_address),
-                'value': value, # مقدار باید به wei باشد
-                'gas': gas_limit,
-                'gasPrice': FIXED_GAS_PRICE_WEI,
-                'nonce': current_nonce, # Nonce در هر تلاش تازه دریافت می‌شود
-                'chainId': CHAIN_ID,
-                'data': data
-            }
-            
-            # امضای تراکنش
-            signed_transaction = w3.eth.account.sign_transaction(transaction, private_key=PRIVATE_KEY)
-            
-            print(f'در حال ارسال تراکنش به: {to_checksum_address(to_address)}، Nonce: {current_nonce}، Value: {w3.from_wei(value, "ether")} INJ (تلاش {attempt + 1}/{retries})')
-            
-            # ارسال تراکنش
-            tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
+            if tx_hash not in journal.pending:
+                tx_hash = None
+                current_nonce = w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')
+                log_event(logger, logging.DEBUG, f"   (دریافت Nonce لحظه‌ای برای تلاش {attempt + 1}/{retries}: {current_nonce})",
+                          stage='nonce', nonce=current_nonce, attempt=attempt + 1, elapsed_ms=elapsed_ms(attempt_start))
+
+            if tx_hash is None:
+                transaction = {
+                    'from': SENDER_ADDRESS,
+                    'to': to_checksum_address(to_address),
+                    'value': value, # مقدار باید به wei باشد
+                    'gas': gas_limit,
+                    'gasPrice': FIXED_GAS_PRICE_WEI,
+                    'nonce': current_nonce, # Nonce در هر تلاش تازه دریافت می‌شود
+                    'chainId': CHAIN_ID,
+                    'data': data
+                }
+
+                # امضای تراکنش
+                signed_transaction = w3.eth.account.sign_transaction(transaction, private_key=PRIVATE_KEY)
+
+                # ثبت در ژورنال قبل از ارسال (در صورت کرش، اجرای بعدی این تراکنش را پیگیری می‌کند)
+                tx_hash = journal.record_broadcast(signed_transaction, SENDER_ADDRESS, current_nonce, job=job, slot=slot)
+                log_event(logger, logging.INFO, f'در حال ارسال تراکنش به: {to_checksum_address(to_address)}، Nonce: {current_nonce}، Value: {w3.from_wei(value, "ether")} INJ (تلاش {attempt + 1}/{retries})',
+                          stage='broadcast', tx_hash=tx_hash, to=to_checksum_address(to_address), nonce=current_nonce, attempt=attempt + 1, value=value, job=job)
+            else:
+                log_event(logger, logging.INFO, f'ارسال مجدد همان تراکنش ثبت شده {tx_hash}، Nonce: {current_nonce} (تلاش {attempt + 1}/{retries})',
+                          stage='rebroadcast', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, job=job)
+
+            # ارسال تراکنش؛ "already known" یعنی نود آن را دارد و فقط منتظر رسید می‌مانیم
+            journal.broadcast(w3, tx_hash)
+            broadcast_ms = elapsed_ms(attempt_start)
             receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120) # افزایش زمان انتظار
+            journal.record_receipt(tx_hash, receipt)
             
-            print(f'تراکنش موفق! هش: {encode_hex(receipt.transactionHash)}')
+            log_event(logger, logging.INFO, f'تراکنش موفق! هش: {encode_hex(receipt.transactionHash)}',
+                      stage='confirmed', tx_hash=encode_hex(receipt.transactionHash), nonce=current_nonce, attempt=attempt + 1,
+                      status=receipt.status, broadcast_ms=broadcast_ms, elapsed_ms=elapsed_ms(attempt_start), sample=False)
             return receipt # تراکنش موفق، از تابع خارج می‌شویم
         except Exception as e:
             error_message = str(e)
-            print(f'خطا در ارسال تراکنش به {to_address} (Nonce: {current_nonce}, تلاش {attempt + 1}/{retries}): {error_message}')
+            # اگر نود تراکنش را صریحاً رد کرده باشد، journal.broadcast آن را FAILED کرده و تلاش بعدی تراکنش جدید امضا می‌کند؛
+            # در غیر این صورت (timeout، قطع اتصال، عدم دریافت رسید) تلاش بعدی همان تراکنش را دوباره ارسال می‌کند
+            log_event(logger, logging.WARNING, f'خطا در ارسال تراکنش به {to_address} (Nonce: {current_nonce}, تلاش {attempt + 1}/{retries}): {error_message}',
+                      stage='error', tx_hash=tx_hash, to=to_address, nonce=current_nonce, attempt=attempt + 1, error=error_message, elapsed_ms=elapsed_ms(attempt_start))
             
             # بررسی نوع خطا برای تصمیم‌گیری درباره تلاش مجدد
-            if "invalid nonce" in error_message or "mempool is full" in error_message or "503" in error_message or "Service Temporarily Unavailable" in error_message or "nonce too low" in error_message or "already known" in error_message:
-                print(f"   تلاش مجدد در {delay} ثانیه...")
+            if "invalid nonce" in error_message or "mempool is full" in error_message or "503" in error_message or "Service Temporarily Unavailable" in error_message or "nonce too low" in error_message or "connection" in error_message.lower() or "timed out" in error_message.lower():
+                log_event(logger, logging.INFO, f"   تلاش مجدد در {delay} ثانیه...",
+                          stage='retry', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, delay=delay)
                 time.sleep(delay)
             else:
                 # برای خطاهای دیگر که با تلاش مجدد حل نمی‌شوند، بلافاصله خطا را بالا می‌بریم
-                print("   خطای غیرقابل حل با تلاش مجدد. توقف.")
+                # (تراکنش ارسال شده در ژورنال معلق می‌ماند و اجرای بعدی آن را پیگیری می‌کند)
+                log_event(logger, logging.ERROR, "   خطای غیرقابل حل با تلاش مجدد. توقف.",
+                          stage='fatal', tx_hash=tx_hash, nonce=current_nonce, attempt=attempt + 1, error=error_message)
                 raise # خطا را بلافاصله برمی‌گردانیم
     
     # اگر بعد از همه تلاش‌ها هم تراکنش موفق نشد
@@ -246,7 +305,7 @@ async def send_transaction(to_address, value, gas_limit, data, retries=10, delay
 
 # --- 3. توابع اجرای تراکنش‌های خاص ---
 
-async def execute_stake():
+async def execute_stake(slot=None):
     """اجرای تراکنش استیک."""
     print('\n--- در حال اجرای تراکنش استیک ---')
     config = next((t for t in ALL_TRANSACTIONS if t['type'] == 'STAKE'), None)
@@ -260,38 +319,45 @@ async def execute_stake():
             value=value_in_wei,
             gas_limit=config['gas_limit'],
             data=config['method_id'],
+            job='STAKE',
+            slot=slot,
         )
     except Exception:
         print('تراکنش استیک شکست خورد.')
 
-async def execute_warp(repeats):
+async def execute_warp(repeats, slot=None):
     """اجرای تراکنش وارپ."""
-    print(f'\n--- در حال اجرای تراکنش وارپ ({repeats} بار) ---')
+    log_event(logger, logging.INFO, f'\n--- در حال اجرای تراکنش وارپ ({repeats} بار) ---', stage='warp_start', repeats=repeats, slot=slot)
     config = next((t for t in ALL_TRANSACTIONS if t['type'] == 'WARP'), None)
     if not config: return
 
     value_in_wei = w3.to_wei(config['value'], 'ether') # INJ دارای 18 رقم اعشار
 
     for i in range(repeats):
+        if journal.is_job_done(f'WARP:{i + 1}', slot):
+            continue # در اجرای قبلی (همین بازه) انجام شده است
         try:
-            print(f'   تکرار وارپ {i + 1}/{repeats}')
+            log_event(logger, logging.INFO, f'   تکرار وارپ {i + 1}/{repeats}', stage='warp', repeat=i + 1, repeats=repeats)
             receipt = await send_transaction(
                 to_address=config['contract'],
                 value=value_in_wei,
                 gas_limit=config['gas_limit'],
                 data=config['method_id'],
+                job=f'WARP:{i + 1}',
+                slot=slot,
             )
             # اگر تراکنش موفق بود، تاخیر می‌دهیم (این تاخیر بین تکرارهاست)
             time.sleep(10) # تاخیر 10 ثانیه‌ای
         except Exception as e:
-            print(f'   تکرار وارپ {i + 1} شکست خورد: {e}. ادامه به تکرار بعدی...')
+            log_event(logger, logging.WARNING, f'   تکرار وارپ {i + 1} شکست خورد: {e}. ادامه به تکرار بعدی...',
+                      stage='warp_failed', repeat=i + 1, repeats=repeats, error=str(e))
             # اگر send_transaction خطای قابل حل با retry داده باشد، خودش retry می‌کند.
             # در غیر این صورت، این حلقه فقط خطا را لاگ کرده و به تکرار بعدی می‌رود.
             # اینجا دیگر نیازی به time.sleep اضافه نیست چون send_transaction خودش تاخیر retry دارد
             # اما یک تاخیر کوچک برای بین تکرارها همچنان مفید است.
             time.sleep(1) # تاخیر کوچک برای جلوگیری از ارسال سریع تراکنش بعدی در صورت شکست
 
-async def execute_unstake():
+async def execute_unstake(slot=None):
     """اجرای تراکنش آن‌استیک."""
     print('\n--- در حال اجرای تراکنش آن‌استیک ---')
     config = next((t for t in ALL_TRANSACTIONS if t['type'] == 'UNSTAKE'), None)
@@ -310,12 +376,14 @@ async def execute_unstake():
             value=0, # مقدار اصلی از طریق data ارسال می‌شود
             gas_limit=config['gas_limit'],
             data=data_bytes,
+            job='UNSTAKE',
+            slot=slot,
         )
     except Exception:
         print('تراکنش آن‌استیک شکست خورد.')
 
 
-async def execute_swap_usdt_to_winj(run_time_key):
+async def execute_swap_usdt_to_winj(run_time_key, slot=None):
     """اجرای تراکنش سواپ USDT به wINJ و ذخیره خروجی."""
     print('\n--- در حال اجرای تراکنش سواپ USDT به wINJ ---')
     config = next((t for t in ALL_TRANSACTIONS if t['type'] == 'SWAP_USDT_TO_WINJ'), None)
@@ -359,6 +427,8 @@ async def execute_swap_usdt_to_winj(run_time_key):
             value=0, # مقدار اصلی از طریق data ارسال می‌شود
             gas_limit=config['gas_limit'],
             data=data_bytes,
+            job='SWAP_USDT_TO_WINJ',
+            slot=slot,
         )
 
         # --- پس از موفقیت‌آمیز بودن تراکنش: دریافت مقدار wINJ دریافتی و ذخیره در فایل JSON ---
@@ -394,7 +464,7 @@ async def execute_swap_usdt_to_winj(run_time_key):
         print('تراکنش سواپ USDT به wINJ شکست خورد.')
 
 
-async def execute_swap_winj_to_usdt(run_time_key_for_input):
+async def execute_swap_winj_to_usdt(run_time_key_for_input, slot=None):
     """اجرای تراکنش سواپ wINJ به USDT با مقدار ورودی دینامیک."""
     print('\n--- در حال اجرای تراکنش سواپ wINJ به USDT ---')
     config = next((t for t in ALL_TRANSACTIONS if t['type'] == 'SWAP_WINJ_TO_USDT'), None)
@@ -403,6 +473,14 @@ async def execute_swap_winj_to_usdt(run_time_key_for_input):
     # خواندن مقدار wINJ از فایل JSON
     swap_outputs = read_swap_outputs()
     input_amount_winj_str = swap_outputs.get(run_time_key_for_input, "0")
+
+    # تطبیق مقدار با داده‌های زنجیره (در صورت کرش اجرای قبلی بعد از سواپ، فایل JSON مقدار را ندارد)
+    chain_amount = reconcile_swap_input(run_time_key_for_input)
+    if chain_amount is not None and str(chain_amount) != input_amount_winj_str:
+        print(f'مقدار wINJ زمان {run_time_key_for_input} از داده‌های زنجیره تطبیق داده شد: {chain_amount} (فایل: {input_amount_winj_str})')
+        input_amount_winj_str = str(chain_amount)
+        swap_outputs[run_time_key_for_input] = input_amount_winj_str
+        write_swap_outputs(swap_outputs)
     
     if not input_amount_winj_str or int(input_amount_winj_str) == 0:
         print(f'اخطار: هیچ wINJ برای سواپ در زمان {run_time_key_for_input} پیدا نشد یا مقدار آن 0 است. تراکنش انجام نمی‌شود.')
@@ -448,6 +526,8 @@ async def execute_swap_winj_to_usdt(run_time_key_for_input):
             value=0,
             gas_limit=config['gas_limit'],
             data=data_bytes,
+            job='SWAP_WINJ_TO_USDT',
+            slot=slot,
         )
     except Exception:
         print('تراکنش سواپ wINJ به USDT شکست خورد.')
@@ -457,16 +537,25 @@ async def execute_swap_winj_to_usdt(run_time_key_for_input):
 async def main():
     print(f'آدرس کیف پول فرستنده: {SENDER_ADDRESS}') 
 
+    # زمان قبل از بازیابی خوانده می‌شود تا بازیابی طولانی پنجره زمان‌بندی را از بین نبرد
     utc_now = datetime.now(pytz.utc)
     current_hour_utc = utc_now.hour
     current_minute_utc = utc_now.minute
     print(f'زمان فعلی UTC: {str(current_hour_utc).zfill(2)}:{str(current_minute_utc).zfill(2)}')
 
+    # پیگیری تراکنش‌های معلق اجرای قبلی (به جای ارسال تکراری آن‌ها)
+    try:
+        journal.recover_pending(w3)
+    except Exception as e:
+        print(f'اخطار: خطا در بازیابی تراکنش‌های معلق: {e}')
+
     for tx_config in ALL_TRANSACTIONS:
         should_run = False
+        slot = None # شناسه بازه زمان‌بندی برای ژورنال (مثلاً '2025-01-01 06:00')
 
         if IS_TEST_MODE:
             should_run = True
+            slot = f"{utc_now.strftime('%Y-%m-%d %H:%M')} test"
             print(f'\n--- حالت تست فعال: اجرای فوری تراکنش "{tx_config["name"]}" ---')
         else:
             schedules = tx_config['schedule'] if isinstance(tx_config['schedule'], list) else [tx_config['schedule']]
@@ -476,6 +565,7 @@ async def main():
                    current_minute_utc >= schedule['minute'] and \
                    current_minute_utc < schedule['minute'] + 5:
                     should_run = True
+                    slot = f"{utc_now.strftime('%Y-%m-%d')} {str(schedule['hour']).zfill(2)}:{str(schedule['minute']).zfill(2)}"
                     break
 
         if should_run:
@@ -483,14 +573,14 @@ async def main():
             
             try:
                 if tx_config['type'] == 'STAKE':
-                    await execute_stake()
+                    await execute_stake(slot)
                 elif tx_config['type'] == 'WARP':
-                    await execute_warp(tx_config['repeats'])
+                    await execute_warp(tx_config['repeats'], slot)
                 elif tx_config['type'] == 'UNSTAKE':
-                    await execute_unstake()
+                    await execute_unstake(slot)
                 elif tx_config['type'] == 'SWAP_USDT_TO_WINJ':
                     usdt_to_winj_run_time_key = f"{str(current_hour_utc).zfill(2)}:{str(current_minute_utc).zfill(2)}"
-                    await execute_swap_usdt_to_winj(usdt_to_winj_run_time_key)
+                    await execute_swap_usdt_to_winj(usdt_to_winj_run_time_key, slot)
                 elif tx_config['type'] == 'SWAP_WINJ_TO_USDT':
                     input_key_for_winj_to_usdt = None
                     if current_hour_utc == 20 and current_minute_utc >= 0:
@@ -504,7 +594,7 @@ async def main():
                         print(f'اخطار: زمان اجرای نامشخص برای سواپ wINJ به USDT. ({current_hour_utc}:{current_minute_utc})')
                         continue 
 
-                    await execute_swap_winj_to_usdt(input_key_for_winj_to_usdt)
+                    await execute_swap_winj_to_usdt(input_key_for_winj_to_usdt, slot)
                 else:
                     print(f'اخطار: نوع تراکنش ناشناخته: {tx_config["type"]}')
             except Exception as e:
@@ -513,6 +603,7 @@ async def main():
             print(f'\n--- تراکنش "{tx_config["name"]}" در حال حاضر اجرا نمی‌شود. ({str(current_hour_utc).zfill(2)}:{str(current_minute_utc).zfill(2)} UTC) ---')
 
     print('\n--- تمامی تراکنش‌های زمان‌بندی شده برای این اجرا بررسی شدند. ---')
+    log_transport_stats(web3Provider, logger)
 
 # اجرای تابع اصلی (به صورت ناهمزمان)
 if __name__ == '__main__':
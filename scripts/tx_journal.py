@@ -0,0 +1,200 @@
+# scripts/tx_journal.py
+
+import os
+import json
+import time
+from eth_utils import encode_hex
+from requests.exceptions import RequestException
+from web3.exceptions import TransactionNotFound
+
+# --- 1. تنظیمات (Configuration) ---
+
+# فایل ژورنال پیش‌نویس (write-ahead) تراکنش‌های ارسال شده
+JOURNAL_FILE = 'data/tx_journal.jsonl'
+# رکوردهای قدیمی‌تر از این مقدار (ثانیه) در زمان باز کردن ژورنال حذف می‌شوند (به جز تراکنش‌های معلق)
+JOURNAL_RETENTION_SECONDS = 3 * 24 * 60 * 60
+# حداکثر زمان انتظار برای رسید هر تراکنش بازیابی شده
+RECOVERY_RECEIPT_TIMEOUT = 60
+# حداکثر زمان کل بازیابی در شروع اجرا (تا پنجره 5 دقیقه‌ای زمان‌بندی از دست نرود)
+RECOVERY_TIME_LIMIT = 90
+
+# وضعیت‌های نهایی یک تراکنش در ژورنال
+STATUS_CONFIRMED = 'confirmed' # رسید با status == 1
+STATUS_REVERTED = 'reverted'   # رسید با status == 0
+STATUS_FAILED = 'failed'       # ارسال به صراحت توسط نود رد شد (خطای JSON-RPC)
+STATUS_DROPPED = 'dropped'     # nonce توسط تراکنش دیگری مصرف شد
+
+# --- 2. ژورنال (Journal) ---
+
+class TxJournal:
+    """ژورنال افزودنی (JSONL) از تراکنش‌های ارسال شده با قابلیت بازیابی پس از کرش.
+
+    قبل از send_raw_transaction یک رکورد 'broadcast' (شامل بایت‌های خام، هش، nonce و job) نوشته می‌شود
+    و پس از مشخص شدن نتیجه یک رکورد 'result'. تراکنش‌های بدون نتیجه، معلق در نظر گرفته می‌شوند.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.pending = {}       # tx_hash -> رکورد broadcast
+        self.completed = set()  # (slot, job) هایی که تراکنش موفق دارند
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b'\n'):
+                # خط ناقص انتهای فایل در صورت کرش حین نوشتن حذف می‌شود تا رکورد بعدی سالم بماند
+                content = content[:content.rfind(b'\n') + 1]
+                f.truncate(len(content))
+        records = []
+        for line in content.decode().splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        for record in records:
+            self._apply(record)
+        self._compact(records)
+
+    def _apply(self, record):
+        if record['event'] == 'broadcast':
+            self.pending[record['tx_hash']] = record
+        elif record['event'] == 'result':
+            self.pending.pop(record['tx_hash'], None)
+            if record['status'] == STATUS_CONFIRMED and record.get('job'):
+                self.completed.add((record.get('slot'), record['job']))
+
+    def _compact(self, records):
+        """حذف رکوردهای قدیمی؛ فایل به صورت اتمیک بازنویسی می‌شود."""
+        cutoff = time.time() - JOURNAL_RETENTION_SECONDS
+        kept = [r for r in records if r['ts'] >= cutoff or r['tx_hash'] in self.pending]
+        if len(kept) == len(records):
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for record in kept:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record):
+        record['ts'] = time.time()
+        journal_dir = os.path.dirname(self.path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno()) # رکورد باید قبل از ارسال تراکنش روی دیسک باشد
+        self._apply(record)
+
+    def record_broadcast(self, signed_transaction, sender, nonce, job=None, slot=None):
+        """ثبت تراکنش امضا شده قبل از ارسال آن به شبکه."""
+        tx_hash = encode_hex(signed_transaction.hash)
+        self._append({
+            'event': 'broadcast',
+            'tx_hash': tx_hash,
+            'raw': encode_hex(signed_transaction.rawTransaction),
+            'from': sender,
+            'nonce': nonce,
+            'job': job,
+            'slot': slot,
+        })
+        return tx_hash
+
+    def record_result(self, tx_hash, status):
+        """ثبت نتیجه نهایی یک تراکنش ثبت شده."""
+        broadcast = self.pending.get(tx_hash, {})
+        self._append({
+            'event': 'result',
+            'tx_hash': tx_hash,
+            'status': status,
+            'job': broadcast.get('job'),
+            'slot': broadcast.get('slot'),
+        })
+
+    def record_receipt(self, tx_hash, receipt):
+        self.record_result(tx_hash, STATUS_CONFIRMED if receipt.status == 1 else STATUS_REVERTED)
+
+    def find_pending(self, job, slot):
+        """هش تراکنش معلق ثبت شده برای این job در این بازه (یا None)."""
+        for tx_hash, record in self.pending.items():
+            if record.get('job') == job and record.get('slot') == slot:
+                return tx_hash
+        return None
+
+    def broadcast(self, w3, tx_hash):
+        """ارسال (یا ارسال مجدد) بایت‌های امضا شده ثبت شده برای tx_hash.
+
+        فقط رد صریح نود (ValueError از JSON-RPC) تراکنش را FAILED می‌کند. خطاهای انتقال (timeout، قطع اتصال)
+        بالا برده می‌شوند و تراکنش معلق می‌ماند، چون ممکن است نود آن را پذیرفته باشد.
+        """
+        try:
+            w3.eth.send_raw_transaction(self.pending[tx_hash]['raw'])
+        except ValueError as e:
+            if isinstance(e, RequestException):
+                raise
+            if 'already known' in str(e):
+                return # نود همین تراکنش را دارد؛ فقط منتظر رسید می‌مانیم
+            # ممکن است در ارسال قبلی ثبت شده باشد (مثلاً nonce too low پس از استخراج)
+            try:
+                w3.eth.get_transaction_receipt(tx_hash)
+                return
+            except TransactionNotFound:
+                pass
+            self.record_result(tx_hash, STATUS_FAILED)
+            raise
+
+    def is_job_done(self, job, slot):
+        """آیا این job در این بازه زمان‌بندی قبلاً با موفقیت انجام شده است؟"""
+        return (slot, job) in self.completed
+
+    def recover_pending(self, w3, time_limit=RECOVERY_TIME_LIMIT):
+        """پیگیری یا ارسال مجدد تراکنش‌های معلق اجرای قبلی به جای ارسال تکراری آن‌ها.
+
+        کل بازیابی حداکثر time_limit ثانیه طول می‌کشد؛ تراکنش‌های باقی‌مانده برای اجرای بعدی معلق می‌مانند.
+        """
+        deadline = time.monotonic() + time_limit
+        for tx_hash, record in sorted(self.pending.items(), key=lambda item: item[1]['nonce']):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f'   مهلت بازیابی تمام شد؛ {len(self.pending)} تراکنش برای اجرای بعدی معلق ماند.')
+                return
+            print(f'بازیابی تراکنش معلق {tx_hash} (Nonce: {record["nonce"]}, Job: {record.get("job")})...')
+            try:
+                self._recover_one(w3, tx_hash, record, min(RECOVERY_RECEIPT_TIMEOUT, remaining))
+            except Exception as e:
+                # خطای RPC نباید کل اجرا را متوقف کند؛ تراکنش (به جز رد صریح) معلق می‌ماند
+                print(f'   بازیابی تراکنش {tx_hash} ناموفق بود: {e}')
+
+    def _recover_one(self, w3, tx_hash, record, receipt_timeout):
+        try:
+            receipt = w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            receipt = None
+
+        if receipt is None:
+            try:
+                w3.eth.get_transaction(tx_hash)
+                in_mempool = True
+            except TransactionNotFound:
+                in_mempool = False
+
+            if not in_mempool:
+                confirmed_nonce = w3.eth.get_transaction_count(record['from'], 'latest')
+                if record['nonce'] < confirmed_nonce:
+                    # تراکنش دیگری این nonce را مصرف کرده است
+                    print(f'   Nonce {record["nonce"]} قبلاً مصرف شده است. تراکنش کنار گذاشته شد.')
+                    self.record_result(tx_hash, STATUS_DROPPED)
+                    return
+                print('   تراکنش در mempool نیست؛ ارسال مجدد همان بایت‌های امضا شده...')
+                self.broadcast(w3, tx_hash)
+
+            # TimeExhausted بالا برده می‌شود و تراکنش در ژورنال معلق باقی می‌ماند
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=receipt_timeout)
+
+        self.record_receipt(tx_hash, receipt)
+        print(f'   تراکنش {tx_hash} بازیابی شد (وضعیت: {receipt.status}).')
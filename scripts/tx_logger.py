@@ -0,0 +1,143 @@
+# scripts/tx_logger.py
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+
+# --- 1. تنظیمات (Configuration) ---
+
+# سطح لاگ (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# مسیر فایل JSONL برای رکوردهای ساختاریافته (رشته خالی = غیرفعال)
+LOG_FILE = os.environ.get('LOG_FILE', 'data/logs/transactions.jsonl')
+# نسبت نمونه‌برداری از رکوردهای کم‌اهمیت (زیر WARNING)؛ 1.0 یعنی همه ثبت می‌شوند
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1.0'))
+# نمایش خوانا در کنسول
+LOG_CONSOLE = os.environ.get('LOG_CONSOLE', 'true') != 'false'
+# حداکثر تعداد رکوردهایی که قبل از نوشتن در فایل بافر می‌شوند
+LOG_BUFFER_SIZE = 20
+
+# فیلدهای ساختاریافته‌ای که از طریق log_event ارسال می‌شوند
+STRUCTURED_FIELDS = 'fields'
+
+# --- 2. فرمت‌کننده‌ها و فیلترها (Formatters & Filters) ---
+
+class JsonlFormatter(logging.Formatter):
+    """تبدیل هر رکورد به یک خط JSON با فیلدهای tx_hash، nonce، stage، attempt و زمان‌بندی."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in getattr(record, STRUCTURED_FIELDS, {}).items():
+            if key != 'sample': # فقط برای SamplingFilter
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    """نمایش خوانا برای کنسول: فقط پیام، به همراه سطح برای هشدارها و خطاها."""
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.levelno >= logging.WARNING:
+            return f'[{record.levelname}] {message}'
+        return message
+
+class SamplingFilter(logging.Filter):
+    """نمونه‌برداری از رکوردهای زیر WARNING؛ رکوردهای با sample=False همیشه ثبت می‌شوند.
+
+    تصمیم روی خود رکورد ذخیره می‌شود تا کنسول و فایل JSONL رکوردهای یکسانی را ببینند.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        keep = getattr(record, '_sample_keep', None)
+        if keep is None:
+            keep = (
+                record.levelno >= logging.WARNING
+                or self.rate >= 1.0
+                or not getattr(record, STRUCTURED_FIELDS, {}).get('sample', True)
+                or random.random() < self.rate
+            )
+            record._sample_keep = keep
+        return keep
+
+class OutcomeMemoryHandler(logging.handlers.MemoryHandler):
+    """بافر رکوردهای فایل که با پر شدن بافر، هشدارها/خطاها یا رکوردهای نتیجه (sample=False) تخلیه می‌شود.
+
+    به این ترتیب نتیجه تراکنش‌ها حتی اگر CI پروسه را بکشد روی دیسک باقی می‌ماند.
+    """
+
+    def shouldFlush(self, record):
+        if not getattr(record, STRUCTURED_FIELDS, {}).get('sample', True):
+            return True
+        return super().shouldFlush(record)
+
+# --- 3. راه‌اندازی نویسنده پس‌زمینه (Background Writer) ---
+
+_listener = None
+
+def _build_file_handler():
+    log_dir = os.path.dirname(LOG_FILE)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+    file_handler.setFormatter(JsonlFormatter())
+    # نوشتن دسته‌ای در فایل؛ هشدارها، خطاها و نتیجه تراکنش‌ها بلافاصله نوشته می‌شوند
+    return OutcomeMemoryHandler(LOG_BUFFER_SIZE, flushLevel=logging.WARNING, target=file_handler)
+
+def _stop_listener():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop() # تخلیه صف
+    for handler in _listener.handlers:
+        handler.flush()
+        handler.close()
+    _listener = None
+
+def get_logger(name):
+    """دریافت logger؛ کنسول همزمان (به ترتیب print ها) و فایل JSONL از طریق صف در پس‌زمینه نوشته می‌شود."""
+    global _listener
+    root = logging.getLogger('injective')
+    if not root.handlers:
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        sampling_filter = SamplingFilter(LOG_SAMPLE_RATE)
+        if LOG_CONSOLE:
+            # نوشتن یک خط در کنسول ارزان است؛ مستقیم نوشته می‌شود تا ترتیب آن با print ها حفظ شود
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(ConsoleFormatter())
+            console_handler.addFilter(sampling_filter)
+            root.addHandler(console_handler)
+        if LOG_FILE:
+            log_queue = queue.SimpleQueue()
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            # رکوردهای حذف شده در نمونه‌برداری اصلاً وارد صف نمی‌شوند
+            queue_handler.addFilter(sampling_filter)
+            root.addHandler(queue_handler)
+            _listener = logging.handlers.QueueListener(log_queue, _build_file_handler())
+            _listener.start()
+            atexit.register(_stop_listener)
+    return root.getChild(name)
+
+def log_event(logger, level, message, **fields):
+    """ثبت یک رکورد با پیام خوانا و فیلدهای ساختاریافته (tx_hash، nonce، stage، attempt، ...)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={STRUCTURED_FIELDS: fields})
+
+def elapsed_ms(start):
+    """میلی‌ثانیه‌های سپری شده از start (مقدار time.monotonic)."""
+    return round((time.monotonic() - start) * 1000, 1)